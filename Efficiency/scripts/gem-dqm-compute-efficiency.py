@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+r"""
+Compute the GE1/1 per-layer efficiency from the GEM TTree written by
+GEMCSCSegmentEfficiencyAnalyzer.
+
+The efficiency of a layer is measured with the other layer as a tag, i.e.
+    denominator: segments with a hit on the tag layer
+    numerator: segments with hits on both the tag and the probe layer
+and every histogram is binned with the tag-layer hit (chamber, ieta, strip and
+bx) or with the matched muon (pt, eta and phi).
+
+The branches are read in chunks as NumPy arrays and filled with bincount.
+Each input file is processed in a worker of a process pool and the
+numerator/denominator counts are summed, so the output can be fed to
+TEfficiency or any Clopper-Pearson interval.
+
+usage:
+    gem-dqm-compute-efficiency.py job_*.root -o efficiency.root -j 8
+    gem-dqm-compute-efficiency.py -f filelist-run.txt -o efficiency.npz
+"""
+from pathlib import Path
+from typing import Union
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import os
+import argparse
+
+import numpy as np
+import uproot
+
+
+LAYER_LIST = (1, 2)
+
+REGION_EDGES = np.array([-1.5, 0.0, 1.5])
+CHAMBER_EDGES = np.arange(0.5, 36.5 + 1)
+IETA_EDGES = np.arange(0.5, 8.5 + 1)
+STRIP_EDGES = np.arange(-0.5, 383.5 + 1)
+BX_EDGES = np.arange(-5.5, 5.5 + 1)
+MUON_PT_EDGES = np.linspace(0, 200, 41)
+MUON_ETA_EDGES = np.linspace(-2.4, 2.4, 49)
+MUON_PHI_EDGES = np.linspace(-np.pi, np.pi, 73)
+
+
+@dataclass(frozen=True)
+class Axis:
+    r"""
+    branch can have a '{tag}' placeholder, which is replaced with the tag layer.
+    """
+    branch: str
+    edges: np.ndarray
+
+    def get_branch(self, tag: int) -> str:
+        return self.branch.format(tag=tag)
+
+
+@dataclass(frozen=True)
+class Histogram:
+    name: str
+    axes: tuple[Axis, ...]
+    muon_only: bool = False
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        return tuple(len(axis.edges) - 1 for axis in self.axes)
+
+    @property
+    def edges(self) -> list[np.ndarray]:
+        return [axis.edges for axis in self.axes]
+
+    def get_branch_list(self, tag: int) -> list[str]:
+        return [axis.get_branch(tag) for axis in self.axes]
+
+    def count(self, arrays: dict[str, np.ndarray], mask: np.ndarray, tag: int) -> np.ndarray:
+        r"""
+        returns the histogram of the masked entries as a flat array
+        """
+        index_list = []
+        for axis in self.axes:
+            value = arrays[axis.get_branch(tag)][mask]
+            index = np.searchsorted(axis.edges, value, side='right') - 1
+            index_list.append(index)
+
+        index_list = np.stack(index_list)
+        # drop underflow and overflow
+        in_range = np.all((index_list >= 0) & (index_list < np.array(self.shape)[:, np.newaxis]), axis=0)
+        flat_index = np.ravel_multi_index(index_list[:, in_range], self.shape)
+        return np.bincount(flat_index, minlength=np.prod(self.shape))
+
+
+REGION_AXIS = Axis('gemcsc_region', REGION_EDGES)
+CHAMBER_AXIS = Axis('gem_chamber', CHAMBER_EDGES)
+
+HISTOGRAM_LIST = (
+    Histogram('chamber', (REGION_AXIS, CHAMBER_AXIS)),
+    Histogram('ieta', (REGION_AXIS, CHAMBER_AXIS, Axis('gem_layer{tag}_ieta', IETA_EDGES))),
+    Histogram('strip', (REGION_AXIS,
+                        Axis('gem_layer{tag}_ieta', IETA_EDGES),
+                        Axis('gem_layer{tag}_strip', STRIP_EDGES))),
+    Histogram('bx', (REGION_AXIS, Axis('gem_layer{tag}_bx', BX_EDGES))),
+    Histogram('muon_pt', (REGION_AXIS, Axis('muon_pt', MUON_PT_EDGES)), muon_only=True),
+    Histogram('muon_eta', (Axis('muon_eta', MUON_ETA_EDGES), ), muon_only=True),
+    Histogram('muon_phi', (REGION_AXIS, Axis('muon_phi', MUON_PHI_EDGES)), muon_only=True),
+)
+
+
+def get_tag(layer: int) -> int:
+    return 2 if layer == 1 else 1
+
+
+def get_key(layer: int, histogram: Histogram, kind: str) -> str:
+    return f'layer{layer}_{histogram.name}_{kind}'
+
+
+def get_branch_list() -> list[str]:
+    branch_set = {f'gem_has_layer{layer}' for layer in LAYER_LIST}
+    branch_set.add('is_matched_with_muon')
+    for histogram in HISTOGRAM_LIST:
+        for layer in LAYER_LIST:
+            branch_set.update(histogram.get_branch_list(get_tag(layer)))
+    return sorted(branch_set)
+
+
+def make_empty_counts() -> dict[str, np.ndarray]:
+    counts = {}
+    for layer in LAYER_LIST:
+        for histogram in HISTOGRAM_LIST:
+            for kind in ('num', 'den'):
+                counts[get_key(layer, histogram, kind)] = np.zeros(np.prod(histogram.shape), dtype=np.int64)
+    return counts
+
+
+def fill(counts: dict[str, np.ndarray], arrays: dict[str, np.ndarray]) -> None:
+    is_muon = arrays['is_matched_with_muon'].astype(bool)
+
+    for layer in LAYER_LIST:
+        tag = get_tag(layer)
+        den_mask = arrays[f'gem_has_layer{tag}'].astype(bool)
+        num_mask = den_mask & arrays[f'gem_has_layer{layer}'].astype(bool)
+
+        for histogram in HISTOGRAM_LIST:
+            if histogram.muon_only:
+                masks = {'num': num_mask & is_muon, 'den': den_mask & is_muon}
+            else:
+                masks = {'num': num_mask, 'den': den_mask}
+
+            for kind, mask in masks.items():
+                counts[get_key(layer, histogram, kind)] += histogram.count(arrays, mask, tag)
+
+
+def process_file(path: str,
+                 tree_path: str,
+                 step_size: Union[int, str],
+) -> tuple[dict[str, np.ndarray], int]:
+    counts = make_empty_counts()
+    num_entries = 0
+    with uproot.open(path) as root_file:
+        tree = root_file[tree_path]
+        for arrays in tree.iterate(get_branch_list(), step_size=step_size, library='np'):
+            fill(counts, arrays)
+            num_entries += len(arrays['is_matched_with_muon'])
+    return counts, num_entries
+
+
+def compute(path_list: list[str],
+            tree_path: str,
+            step_size: Union[int, str],
+            num_workers: int,
+) -> tuple[dict[str, np.ndarray], int]:
+    r"""
+    returns the flat numerator/denominator counts summed over path_list and
+    the total number of entries
+    """
+    counts = make_empty_counts()
+    num_entries = 0
+
+    func = partial(process_file, tree_path=tree_path, step_size=step_size)
+    chunksize = max(1, len(path_list) // (4 * num_workers))
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        result_iter = executor.map(func, path_list, chunksize=chunksize)
+        for index, (file_counts, file_num_entries) in enumerate(result_iter, start=1):
+            for key, value in file_counts.items():
+                counts[key] += value
+            num_entries += file_num_entries
+            if index % 100 == 0 or index == len(path_list):
+                print(f'[{index}/{len(path_list)}] {num_entries} entries processed')
+    return counts, num_entries
+
+
+def write(output_path: Path, counts: dict[str, np.ndarray], num_entries: int) -> None:
+    if output_path.suffix == '.npz':
+        data = {key: value.reshape(histogram.shape)
+                for key, value, histogram in iter_counts(counts)}
+        for histogram in HISTOGRAM_LIST:
+            for axis_index, edges in enumerate(histogram.edges):
+                data[f'{histogram.name}_edges{axis_index}'] = edges
+        data['num_entries'] = np.array(num_entries)
+        np.savez_compressed(output_path, **data)
+    elif output_path.suffix == '.root':
+        with uproot.recreate(output_path) as root_file:
+            for key, value, histogram in iter_counts(counts):
+                value = value.reshape(histogram.shape).astype(np.float64)
+                layer, name = key.split('_', 1)
+                if len(histogram.shape) == 3:
+                    # numpy.histogramdd convention
+                    root_file[f'{layer}/{name}'] = (value, histogram.edges)
+                else:
+                    root_file[f'{layer}/{name}'] = (value, *histogram.edges)
+    else:
+        raise ValueError(f'expected .npz or .root but got {output_path.suffix}')
+
+
+def iter_counts(counts: dict[str, np.ndarray]):
+    for layer in LAYER_LIST:
+        for histogram in HISTOGRAM_LIST:
+            for kind in ('num', 'den'):
+                key = get_key(layer, histogram, kind)
+                yield key, counts[key], histogram
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('input_path', type=str, nargs='*', help='ROOT files from GEMCSCSegmentEfficiencyAnalyzer')
+    parser.add_argument('-f', '--file-list', type=Path, help='a text file made by gem-dqm-make-file-list.py')
+    parser.add_argument('-o', '--output-path', type=Path, required=True, help='.npz or .root')
+    parser.add_argument('-t', '--tree-path', type=str, default='GEMCSCSegmentEfficiencyAnalyzer/GEM')
+    parser.add_argument('-s', '--step-size', type=str, default='100 MB',
+                        help='number of entries or memory size per chunk')
+    parser.add_argument('-j', '--num-workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    path_list = list(args.input_path)
+    if args.file_list is not None:
+        path_list += args.file_list.read_text().split()
+    if len(path_list) == 0:
+        parser.error('no input file')
+    if args.output_path.exists():
+        raise FileExistsError(args.output_path)
+
+    # strip the 'file:' prefix for cmsRun
+    path_list = [each[len('file:'):] if each.startswith('file:') else each for each in path_list]
+
+    step_size = int(args.step_size) if args.step_size.isdigit() else args.step_size
+
+    counts, num_entries = compute(path_list, args.tree_path, step_size, args.num_workers)
+    write(args.output_path, counts, num_entries)
+    print(f'{num_entries} entries from {len(path_list)} files written to {args.output_path}')
+
+
+if __name__ == '__main__':
+    main()
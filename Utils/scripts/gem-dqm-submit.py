@@ -19,6 +19,8 @@ import re
 import json
 import argparse
 import socket
+import time
+from datetime import datetime
 
 import htcondor
 
@@ -68,16 +70,29 @@ echo "ARGS: ${{ARGS}}"
 ################################################################################
 # run
 cmsRun ${{ARGS}}
+CMSRUN_STATUS=$?
+echo "CMSRUN_STATUS: ${{CMSRUN_STATUS}}"
 
 ################################################################################
 # transfer output files
-{output_transfer_cmd}
+TRANSFER_STATUS=0
+if [ ${{CMSRUN_STATUS}} -eq 0 ]; then
+    {output_transfer_cmd}
+    TRANSFER_STATUS=$?
+    echo "TRANSFER_STATUS: ${{TRANSFER_STATUS}}"
+fi
 
 rm -vf {output_file}
 
 ################################################################################
 # terminate
 echo "end: $(date)"
+
+# the exit code is the return value in condor.log, see CondorLogTracker
+if [ ${{CMSRUN_STATUS}} -ne 0 ]; then
+    exit ${{CMSRUN_STATUS}}
+fi
+exit ${{TRANSFER_STATUS}}
 """
 
 
@@ -110,7 +125,10 @@ class CfgInfo:
             print(f'Temporary cfg: {test_cfg_path.stem}')
 
             sys.path.append(tmp_pythonpath)
-            cfg_module = importlib.import_module(test_cfg_path.stem)
+            try:
+                cfg_module = importlib.import_module(test_cfg_path.stem)
+            finally:
+                sys.path.remove(tmp_pythonpath)
 
             source_type = cfg_module.process.source.type_()
             if source_type not in ('EmptySource', 'PoolSource'):
@@ -277,9 +295,16 @@ class CondorHelperBase(abc.ABC):
             else:
                 itemdata = self.make_itemdata()
                 self.num_jobs = len(itemdata)
+                # ordered by ProcId. used by CondorLogTracker.resubmit
+                with open(self.log_dir.joinpath('itemdata.json'), 'w') as json_file:
+                    json.dump(itemdata, json_file)
                 cluster_id = submit.queue_with_itemdata(txn, itemdata=iter(itemdata))
                 cluster_id = cluster_id.cluster()
 
+        # used by CondorLogTracker
+        with open(self.log_dir.joinpath('cluster.json'), 'w') as json_file:
+            json.dump({'cluster_id': cluster_id, 'num_jobs': self.num_jobs}, json_file)
+
         print(f'{self.num_jobs} jobs submmited with {cluster_id=}')
 
     @abc.abstractmethod
@@ -314,8 +339,8 @@ class DefaultCondorHelper(CondorHelperBase):
         # FIXME
         return f'rsync -avzhr {self.output_file} {self.output_dir}{self.new_output_file}'
 
-    def make_input_itemdata(self):
-        return [{'input_file': str(each) for each in self.input_dir.glob('*.root')}]
+    def make_itemdata(self) -> list[dict[str, str]]:
+        return [{'input_file': str(each)} for each in self.input_dir.glob('*.root')]
 
     @property
     def host_dependent_submit_attribute(self) -> dict[str, str]:
@@ -407,7 +432,7 @@ class GateCondorHelper(CondorHelperBase):
             import pydoop.hdfs
             hdfs = pydoop.hdfs.hdfs()
 
-            input_dir = self.input_dir[len('/hdfs'):]
+            input_dir = self.to_hdfs_path(self.input_dir)
 
             for each in hdfs.walk(input_dir): # FIXME
                 if each['kind'] != 'file':
@@ -420,7 +445,7 @@ class GateCondorHelper(CondorHelperBase):
                 rank = [f"(machine==\"{node}\")*3" for node in datanode_list]
                 rank += self.freenode_rank
 
-                itemdata.append({"input_file": 'file:' + fuse_path, "rank":rank}) # FIXME file:
+                itemdata.append({"input_file": 'file:' + fuse_path, "rank": ' + '.join(rank)}) # FIXME file:
         else:
             for each in self.input_dir.glob('*.root'):
                 itemdata.append({"input_file": 'file:' + str(each)}) # FIXME file:
@@ -428,7 +453,7 @@ class GateCondorHelper(CondorHelperBase):
 
     def make_output_transfer_cmd(self):
         if self.is_output_dir_hdfs:
-            output_dest = self.output_dir[len('/hdfs'): ]
+            output_dest = self.to_hdfs_path(self.output_dir)
             output_transfer_cmd = f'hdfs dfs -put {self.output_file} {output_dest}/{self.new_output_file}'
         else:
             output_transfer_cmd = f'rsync -azv {self.output_file} {self.output_dir}/{self.new_output_file}'
@@ -438,12 +463,341 @@ class GateCondorHelper(CondorHelperBase):
     def host_dependent_submit_attribute(self) -> dict[str, str]:
         attrs = {}
         if self.is_input_dir_hdfs:
-            attrs['Rank'] = "$(rank)",
+            attrs['Rank'] = "$(rank)"
         return attrs
 
-def main():
+
+@dataclass
+class JobState:
+    proc_id: int
+    status: str = 'idle'
+    exit_code: Optional[int] = None
+    submit_time: Optional[float] = None
+    start_time: Optional[float] = None
+    end_time: Optional[float] = None
+    num_submits: int = 1
+
+    def is_finished(self, resubmit: bool, max_submits: int) -> bool:
+        r"""
+        held jobs count as finished because they need a manual condor_release
+        or condor_rm. A failed job is finished unless it will be resubmitted.
+        """
+        if self.status in ('done', 'held', 'removed'):
+            return True
+        if self.status == 'failed':
+            return not resubmit or self.num_submits >= max_submits
+        return False
+
+
+class CondorLogTracker:
+    r"""
+    follows log_dir/condor.log from the offset saved in log_dir/tracker.json,
+    so that each event is parsed only once and the schedd is never queried.
+    """
+    # https://htcondor.readthedocs.io/en/latest/codes-other-values/job-event-log-codes.html
+    SUBMIT = '000'
+    EXECUTE = '001'
+    EXECUTABLE_ERROR = '002'
+    EVICTED = '004'
+    TERMINATED = '005'
+    ABORTED = '009'
+    HELD = '012'
+    RELEASED = '013'
+
+    EVENT_DELIMITER = b'...\n'
+
+    event_pattern = re.compile(r'^(\d{3}) \((\d+)\.(\d+)\.\d+\) (\S+ \S+) ')
+    normal_termination_pattern = re.compile(r'Normal termination \(return value (\d+)\)')
+    abnormal_termination_pattern = re.compile(r'Abnormal termination \(signal (\d+)\)')
+
+    def __init__(self, log_dir: Path) -> None:
+        self.log_dir = Path(log_dir)
+        self.log_path = self.log_dir / 'condor.log'
+        self.state_path = self.log_dir / 'tracker.json'
+
+        self.offset = 0
+        self.cluster_id: Optional[int] = None
+        # resubmitted ClusterId -> ProcId -> original ProcId
+        self.cluster_map: dict[int, dict[int, int]] = {}
+        self.jobs: dict[int, JobState] = {}
+
+        # the cluster size written by CondorHelperBase.queue
+        self.num_jobs: Optional[int] = None
+        cluster_path = self.log_dir / 'cluster.json'
+        itemdata_path = self.log_dir / 'itemdata.json'
+        if cluster_path.exists():
+            with open(cluster_path, 'r') as json_file:
+                cluster = json.load(json_file)
+            self.cluster_id = cluster['cluster_id']
+            self.num_jobs = cluster['num_jobs']
+        elif itemdata_path.exists():
+            with open(itemdata_path, 'r') as json_file:
+                self.num_jobs = len(json.load(json_file))
+
+        if self.state_path.exists():
+            self.load()
+
+    def load(self) -> None:
+        with open(self.state_path, 'r') as json_file:
+            state = json.load(json_file)
+        self.offset = state['offset']
+        self.cluster_id = state['cluster_id']
+        self.cluster_map = {int(cluster): {int(proc): original for proc, original in proc_map.items()}
+                            for cluster, proc_map in state['cluster_map'].items()}
+        self.jobs = {int(proc_id): JobState(**job) for proc_id, job in state['jobs'].items()}
+
+    def save(self) -> None:
+        state = {
+            'offset': self.offset,
+            'cluster_id': self.cluster_id,
+            'cluster_map': self.cluster_map,
+            'jobs': {proc_id: vars(job) for proc_id, job in self.jobs.items()},
+        }
+        with open(self.state_path, 'w') as json_file:
+            json.dump(state, json_file)
+
+    def update(self) -> int:
+        r"""
+        parses the complete events appended since the last call and returns
+        the number of them
+        """
+        if not self.log_path.exists():
+            return 0
+
+        with open(self.log_path, 'rb') as log_file:
+            log_file.seek(self.offset)
+            chunk = log_file.read()
+
+        # the last event can be partially written
+        end = chunk.rfind(self.EVENT_DELIMITER)
+        if end < 0:
+            return 0
+        end += len(self.EVENT_DELIMITER)
+
+        event_list = chunk[:end].decode(errors='replace').split(self.EVENT_DELIMITER.decode())[:-1]
+        for event in event_list:
+            self.parse_event(event)
+
+        self.offset += end
+        self.save()
+        return len(event_list)
+
+    def to_proc_id(self, cluster_id: int, proc_id: int) -> Optional[int]:
+        if cluster_id in self.cluster_map:
+            return self.cluster_map[cluster_id].get(proc_id)
+        if self.cluster_id is None:
+            self.cluster_id = cluster_id
+        return proc_id if cluster_id == self.cluster_id else None
+
+    @staticmethod
+    def parse_time(timestamp: str) -> float:
+        try:
+            event_time = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            # old format without the year
+            event_time = datetime.strptime(timestamp, '%m/%d %H:%M:%S')
+            event_time = event_time.replace(year=datetime.now().year)
+        return event_time.timestamp()
+
+    def parse_event(self, event: str) -> None:
+        match = self.event_pattern.match(event.lstrip())
+        if match is None:
+            return
+        code, cluster_id, proc_id, timestamp = match.groups()
+
+        proc_id = self.to_proc_id(int(cluster_id), int(proc_id))
+        if proc_id is None:
+            warnings.warn(f'ignore an event from an unknown cluster {cluster_id}', RuntimeWarning)
+            return
+
+        job = self.jobs.setdefault(proc_id, JobState(proc_id=proc_id))
+        event_time = self.parse_time(timestamp)
+
+        if code == self.SUBMIT:
+            job.status = 'idle'
+            if job.submit_time is None:
+                job.submit_time = event_time
+        elif code == self.EXECUTE:
+            job.status = 'running'
+            job.start_time = event_time
+        elif code in (self.EVICTED, self.RELEASED):
+            job.status = 'idle'
+        elif code == self.HELD:
+            job.status = 'held'
+        elif code == self.TERMINATED:
+            job.end_time = event_time
+            if (normal := self.normal_termination_pattern.search(event)) is not None:
+                job.exit_code = int(normal.group(1))
+                job.status = 'done' if job.exit_code == 0 else 'failed'
+            else:
+                abnormal = self.abnormal_termination_pattern.search(event)
+                job.exit_code = -int(abnormal.group(1)) if abnormal is not None else None
+                job.status = 'failed'
+        elif code == self.EXECUTABLE_ERROR:
+            job.end_time = event_time
+            job.status = 'failed'
+        elif code == self.ABORTED:
+            # condor_rm is a user decision, so never resubmitted
+            job.end_time = event_time
+            job.status = 'removed'
+
+    @property
+    def failed_proc_id_list(self) -> list[int]:
+        return sorted(proc_id for proc_id, job in self.jobs.items() if job.status == 'failed')
+
+    @property
+    def held_proc_id_list(self) -> list[int]:
+        return sorted(proc_id for proc_id, job in self.jobs.items() if job.status == 'held')
+
+    @property
+    def total(self) -> int:
+        r"""
+        the cluster size if known, otherwise the number of jobs seen in the log
+        """
+        return self.num_jobs if self.num_jobs is not None else len(self.jobs)
+
+    def is_finished(self, resubmit: bool, max_submits: int) -> bool:
+        if len(self.jobs) == 0 or len(self.jobs) < self.total:
+            return False
+        return all(job.is_finished(resubmit, max_submits) for job in self.jobs.values())
+
+    @staticmethod
+    def format_duration(seconds: float) -> str:
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        days, hours = divmod(hours, 24)
+        duration = f'{hours:02d}:{minutes:02d}:{seconds:02d}'
+        if days > 0:
+            duration = f'{days}d {duration}'
+        return duration
+
+    def summary(self) -> str:
+        status_list = ('idle', 'running', 'held', 'done', 'failed', 'removed')
+        count = {status: 0 for status in status_list}
+        for job in self.jobs.values():
+            count[job.status] += 1
+
+        num_jobs = self.total
+        num_finished = count['done'] + count['failed'] + count['removed']
+        # the submit events of these are not in the log yet
+        count['idle'] += max(0, num_jobs - len(self.jobs))
+
+        lines = [f'cluster_id={self.cluster_id}: {num_jobs} jobs']
+        lines.append(' '.join(f'{status}={count[status]}' for status in status_list))
+
+        submit_time_list = [job.submit_time for job in self.jobs.values() if job.submit_time is not None]
+        end_time_list = [job.end_time for job in self.jobs.values() if job.end_time is not None]
+        if num_finished > 0 and len(submit_time_list) > 0:
+            elapsed = max(end_time_list) - min(submit_time_list)
+            if elapsed > 0:
+                throughput = num_finished / (elapsed / 3600)
+                eta = (num_jobs - num_finished - count['held']) / throughput * 3600
+                lines.append(f'throughput: {throughput:.1f} jobs/hour, ETA: {self.format_duration(eta)}')
+
+        failed_proc_id_list = self.failed_proc_id_list
+        if len(failed_proc_id_list) > 0:
+            failed = ', '.join(f'{proc_id}({self.jobs[proc_id].exit_code})' for proc_id in failed_proc_id_list[:20])
+            if len(failed_proc_id_list) > 20:
+                failed += ', ...'
+            lines.append(f'failed ProcId(exit code): {failed}')
+
+        held_proc_id_list = self.held_proc_id_list
+        if len(held_proc_id_list) > 0:
+            held = ', '.join(str(proc_id) for proc_id in held_proc_id_list[:20])
+            if len(held_proc_id_list) > 20:
+                held += ', ...'
+            lines.append(f'held ProcId (needs condor_release or condor_rm): {held}')
+
+        removed_proc_id_list = sorted(proc_id for proc_id, job in self.jobs.items() if job.status == 'removed')
+        if len(removed_proc_id_list) > 0:
+            removed = ', '.join(str(proc_id) for proc_id in removed_proc_id_list[:20])
+            if len(removed_proc_id_list) > 20:
+                removed += ', ...'
+            lines.append(f'removed ProcId (not resubmitted): {removed}')
+        return '\n'.join(lines)
+
+    def resubmit(self, max_submits: int) -> None:
+        r"""
+        resubmits the failed jobs with their original itemdata. The original
+        ProcId is passed as $(proc_id) so the output files keep their names.
+        """
+        proc_id_list = [proc_id for proc_id in self.failed_proc_id_list
+                        if self.jobs[proc_id].num_submits < max_submits]
+        if len(proc_id_list) == 0:
+            return
+
+        with open(self.log_dir / 'submit.json', 'r') as json_file:
+            submit = json.load(json_file)
+        for key in ('arguments', 'output', 'error'):
+            submit[key] = submit[key].replace('$(ProcId)', '$(proc_id)')
+
+        itemdata_path = self.log_dir / 'itemdata.json'
+        if itemdata_path.exists():
+            with open(itemdata_path, 'r') as json_file:
+                original_itemdata = json.load(json_file)
+        else:
+            # EmptySource
+            original_itemdata = None
+
+        itemdata = []
+        for proc_id in proc_id_list:
+            item = dict(original_itemdata[proc_id]) if original_itemdata is not None else {}
+            item['proc_id'] = str(proc_id)
+            itemdata.append(item)
+
+        submit = htcondor.Submit(submit)
+        schedd = htcondor.Schedd()
+        with schedd.transaction() as txn:
+            cluster_id = submit.queue_with_itemdata(txn, itemdata=iter(itemdata))
+            cluster_id = cluster_id.cluster()
+
+        self.cluster_map[cluster_id] = dict(enumerate(proc_id_list))
+        for proc_id in proc_id_list:
+            job = self.jobs[proc_id]
+            job.status = 'idle'
+            job.exit_code = None
+            job.start_time = None
+            job.end_time = None
+            job.num_submits += 1
+        self.save()
+
+        print(f'{len(proc_id_list)} jobs resubmitted with {cluster_id=}: {proc_id_list}')
+
+
+def main_track(argv: list[str]):
     parser = argparse.ArgumentParser(
+        prog=f'{Path(sys.argv[0]).name} track',
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('log_dir', type=Path)
+    parser.add_argument('-f', '--follow', action='store_true', help='keep tracking until all jobs finish')
+    parser.add_argument('-i', '--interval', type=int, default=60, help='seconds between updates')
+    parser.add_argument('-r', '--resubmit', action='store_true', help='resubmit the failed jobs')
+    parser.add_argument('--max-submits', type=int, default=3,
+                        help='do not resubmit a job submitted this many times')
+    args = parser.parse_args(argv)
+
+    tracker = CondorLogTracker(args.log_dir)
+    while True:
+        tracker.update()
+        print(f'[{time.strftime("%Y-%m-%d %H:%M:%S")}]')
+        print(tracker.summary())
+
+        if args.resubmit:
+            tracker.resubmit(args.max_submits)
+
+        if not args.follow or tracker.is_finished(args.resubmit, args.max_submits):
+            break
+        time.sleep(args.interval)
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'track':
+        main_track(sys.argv[2:])
+        return
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        epilog='to follow the submitted jobs, run "%(prog)s track LOG_DIR"')
     parser.add_argument('cfg_file', type=Path, help='config')
     parser.add_argument('-o', '--output-dir', type=Path, required=True)
     parser.add_argument('-l', '--log-dir', type=Path)
@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+r"""
+Benchmark the submission pipeline of gem-dqm-submit.py off-site.
+
+htcondor, pydoop.hdfs and XRootD.client are replaced with in-process fakes so
+that nothing is submitted and no storage is touched. The CMSSW python modules
+are faked only if they cannot be imported.
+
+Each stage (CfgInfo.from_file, make_itemdata, make_output_transfer_cmd and
+CondorHelperBase.queue) is timed on synthetic directory trees for the Default,
+KISTI and Gate helpers. Peak memory is measured with tracemalloc in a separate
+pass so that it does not inflate the timing. Results are
+appended to a JSON file keyed by the git commit so that two commits can be
+compared with --compare.
+
+usage:
+    python3 benchmarkSubmit.py -s 1000 10000 100000
+    python3 benchmarkSubmit.py -s 1000000 --stage make_itemdata
+    python3 benchmarkSubmit.py --compare BASELINE_COMMIT
+"""
+import sys
+import types
+import importlib.util
+import contextlib
+import io
+import time
+import tracemalloc
+import tempfile
+import subprocess
+import socket
+import json
+import argparse
+from pathlib import Path
+from typing import Callable, Optional
+
+
+SUBMIT_SCRIPT = Path(__file__).resolve().parents[1] / 'scripts' / 'gem-dqm-submit.py'
+
+# GateCondorHelper.make_itemdata strips the first 29 characters of the names
+# returned by pydoop, i.e. the namenode URI.
+FAKE_HDFS_URI = 'hdfs://namenode.sscc.uos:9000'
+FAKE_DATANODE_LIST = ['kcms01.sscc.uos', 'kcms02.sscc.uos', 'kcms03.sscc.uos']
+
+CFG_TEMPLATE = r"""import FWCore.ParameterSet.Config as cms
+
+process = cms.Process('BENCHMARK')
+
+from FWCore.ParameterSet.VarParsing import VarParsing
+options = VarParsing('analysis')
+options.parseArguments()
+
+process.source = cms.Source("PoolSource",
+    fileNames = cms.untracked.vstring(options.inputFiles),
+)
+
+process.TFileService = cms.Service("TFileService",
+    fileName = cms.string(options.outputFile)
+)
+"""
+
+
+################################################################################
+# fake back ends
+################################################################################
+def make_fake_htcondor() -> types.ModuleType:
+    htcondor = types.ModuleType('htcondor')
+
+    class SubmitResult:
+        def __init__(self, cluster_id: int, num_procs: int) -> None:
+            self._cluster_id = cluster_id
+            self._num_procs = num_procs
+
+        def cluster(self) -> int:
+            return self._cluster_id
+
+        def num_procs(self) -> int:
+            return self._num_procs
+
+    class Submit(dict):
+        cluster_id = 0
+
+        def __str__(self):
+            return '\n'.join(f'{key} = {value}' for key, value in self.items())
+
+        def _next_cluster_id(self) -> int:
+            Submit.cluster_id += 1
+            return Submit.cluster_id
+
+        def queue(self, txn, count=1):
+            txn.num_procs += count
+            return self._next_cluster_id()
+
+        def queue_with_itemdata(self, txn, count=1, itemdata=None):
+            # the schedd consumes the whole iterator and, like the real
+            # bindings, only accepts str values
+            num_procs = 0
+            for item in itemdata:
+                for key, value in item.items():
+                    if not isinstance(value, str):
+                        raise TypeError(f'itemdata value of {key!r} must be str but got {type(value).__name__}')
+                num_procs += count
+            txn.num_procs += num_procs
+            return SubmitResult(self._next_cluster_id(), num_procs)
+
+    class Transaction:
+        def __init__(self) -> None:
+            self.num_procs = 0
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            return False
+
+    class Schedd:
+        def transaction(self):
+            return Transaction()
+
+    htcondor.Submit = Submit
+    htcondor.Schedd = Schedd
+    return htcondor
+
+
+def make_fake_pydoop(num_files: Callable[[], int]) -> dict[str, types.ModuleType]:
+    pydoop = types.ModuleType('pydoop')
+    hdfs_module = types.ModuleType('pydoop.hdfs')
+
+    class FakeHDFS:
+        def walk(self, top):
+            yield {'kind': 'directory', 'name': f'{FAKE_HDFS_URI}{top}'}
+            for index in range(num_files()):
+                yield {'kind': 'file', 'name': f'{FAKE_HDFS_URI}{top}/output_{index}.root'}
+
+        def get_hosts(self, path, start, length):
+            return [FAKE_DATANODE_LIST]
+
+    hdfs_module.hdfs = FakeHDFS
+    hdfs_module.mkdir = lambda path: None
+    pydoop.hdfs = hdfs_module
+    return {'pydoop': pydoop, 'pydoop.hdfs': hdfs_module}
+
+
+def make_fake_xrootd() -> dict[str, types.ModuleType]:
+    xrootd = types.ModuleType('XRootD')
+    client = types.ModuleType('XRootD.client')
+    flags = types.ModuleType('XRootD.client.flags')
+
+    class MkDirFlags:
+        NONE = 0
+        MAKEPATH = 1
+
+    class FileSystem:
+        def __init__(self, url: str) -> None:
+            self.url = url
+
+        def mkdir(self, path, flags=MkDirFlags.NONE):
+            return None, None
+
+    flags.MkDirFlags = MkDirFlags
+    client.FileSystem = FileSystem
+    client.flags = flags
+    xrootd.client = client
+    return {'XRootD': xrootd, 'XRootD.client': client, 'XRootD.client.flags': flags}
+
+
+def make_fake_cmssw() -> dict[str, types.ModuleType]:
+    r"""the subset of the CMSSW python configuration used by CfgInfo"""
+    config = types.ModuleType('FWCore.ParameterSet.Config')
+
+    class _Parameter:
+        def __init__(self, value) -> None:
+            self._value = value
+
+        def value(self):
+            return self._value
+
+    class _Typed:
+        def __init__(self, type_: str, **kwargs) -> None:
+            self._type = type_
+            for key, value in kwargs.items():
+                setattr(self, key, value)
+
+        def type_(self) -> str:
+            return self._type
+
+    class Source(_Typed):
+        pass
+
+    class Service(_Typed):
+        pass
+
+    class OutputModule(_Typed):
+        pass
+
+    class Process:
+        def __init__(self, name: str, *modifiers) -> None:
+            self._name = name
+
+    config.string = _Parameter
+    config.int32 = _Parameter
+    config.untracked = types.SimpleNamespace(vstring=lambda *args: _Parameter(list(args)),
+                                             int32=_Parameter)
+    config.Source = Source
+    config.Service = Service
+    config.OutputModule = OutputModule
+    config.Process = Process
+
+    var_parsing = types.ModuleType('FWCore.ParameterSet.VarParsing')
+
+    class VarParsing:
+        def __init__(self, mode: str) -> None:
+            self.inputFiles = []
+            self.outputFile = 'output.root'
+            self.maxEvents = -1
+
+        def parseArguments(self) -> None:
+            pass
+
+    var_parsing.VarParsing = VarParsing
+
+    random_service_helper = types.ModuleType('IOMC.RandomEngine.RandomServiceHelper')
+
+    class RandomNumberServiceHelper:
+        def __init__(self, service) -> None:
+            self._service = service
+
+    random_service_helper.RandomNumberServiceHelper = RandomNumberServiceHelper
+
+    module_dict = {
+        'FWCore.ParameterSet.Config': config,
+        'FWCore.ParameterSet.VarParsing': var_parsing,
+        'IOMC.RandomEngine.RandomServiceHelper': random_service_helper,
+    }
+    for name in ('FWCore', 'FWCore.ParameterSet', 'IOMC', 'IOMC.RandomEngine'):
+        module_dict[name] = types.ModuleType(name)
+    module_dict['FWCore'].ParameterSet = module_dict['FWCore.ParameterSet']
+    module_dict['FWCore.ParameterSet'].Config = config
+    module_dict['FWCore.ParameterSet'].VarParsing = var_parsing
+    module_dict['IOMC'].RandomEngine = module_dict['IOMC.RandomEngine']
+    module_dict['IOMC.RandomEngine'].RandomServiceHelper = random_service_helper
+    return module_dict
+
+
+def load_submit_module(num_files: Callable[[], int]):
+    r"""import gem-dqm-submit.py with the fake back ends installed"""
+    sys.modules['htcondor'] = make_fake_htcondor()
+    sys.modules |= make_fake_pydoop(num_files)
+    sys.modules |= make_fake_xrootd()
+    if importlib.util.find_spec('FWCore') is None:
+        sys.modules |= make_fake_cmssw()
+
+    spec = importlib.util.spec_from_file_location('gem_dqm_submit', SUBMIT_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+################################################################################
+# synthetic inputs
+################################################################################
+def make_synthetic_tree(root: Path, num_files: int) -> Path:
+    r"""create num_files empty ROOT files and some non-ROOT noise"""
+    input_dir = root / f'input_{num_files}'
+    if input_dir.exists():
+        return input_dir
+    input_dir.mkdir(parents=True)
+    for index in range(num_files):
+        input_dir.joinpath(f'output_{index}.root').touch()
+    for index in range(max(1, num_files // 100)):
+        input_dir.joinpath(f'output_{index}.log').touch()
+    input_dir.joinpath('subdir').mkdir()
+    return input_dir
+
+
+def make_helper_factory(submit, helper_name: str, root: Path):
+    if helper_name == 'Default':
+        return submit.DefaultCondorHelper, lambda input_dir: input_dir, lambda: root / 'output'
+    elif helper_name == 'KISTI':
+        class SyntheticKISTICondorHelper(submit.KISTICondorHelper):
+            r"""maps the synthetic tree onto /xrootd/"""
+
+            def to_xrootd_url(self, path):
+                path = str(path).replace(str(root), '/xrootd/store/user/benchmark', 1)
+                return super().to_xrootd_url(path)
+
+        return (SyntheticKISTICondorHelper,
+                lambda input_dir: input_dir,
+                lambda: Path('/xrootd/store/user/benchmark/output'))
+    elif helper_name == 'Gate':
+        return (submit.GateCondorHelper,
+                lambda input_dir: Path('/hdfs/store/user/benchmark') / input_dir.name,
+                lambda: Path('/hdfs/store/user/benchmark/output'))
+    else:
+        raise ValueError(helper_name)
+
+
+################################################################################
+# measurement
+################################################################################
+def measure(func: Callable, repeat: int) -> dict[str, float]:
+    r"""
+    return the best wall time of func and its peak traced memory. tracemalloc
+    slows down every allocation, so the memory is measured in a separate pass.
+    """
+    elapsed_list = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            elapsed_list.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        try:
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {
+        'time': min(elapsed_list),
+        'time_mean': sum(elapsed_list) / len(elapsed_list),
+        'peak_memory': peak,
+    }
+
+
+def run_benchmark(sizes: list[int],
+                  helper_list: list[str],
+                  stage_list: list[str],
+                  repeat: int,
+                  workdir: Optional[Path] = None,
+) -> list[dict]:
+    current = {'num_files': 0}
+    submit = load_submit_module(lambda: current['num_files'])
+
+    result_list = []
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp_dir:
+        root = Path(tmp_dir)
+
+        cfg_dir = root / 'cfg'
+        cfg_dir.mkdir()
+        cfg_counter = iter(range(sys.maxsize))
+
+        def from_file():
+            # a new module name each time, otherwise importlib returns the cache
+            cfg_path = cfg_dir / f'benchmark_cfg_{next(cfg_counter)}.py'
+            cfg_path.write_text(CFG_TEMPLATE)
+            return submit.CfgInfo.from_file(cfg_path)
+
+        if 'from_file' in stage_list:
+            record = {'helper': None, 'stage': 'from_file', 'num_files': 0}
+            record |= measure(from_file, repeat)
+            result_list.append(record)
+            print_record(record)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            cfg_info = from_file()
+
+        cfg_file = root / 'benchmark_cfg.py'
+        cfg_file.write_text(CFG_TEMPLATE)
+
+        for num_files in sizes:
+            current['num_files'] = num_files
+            synthetic_dir = make_synthetic_tree(root, num_files)
+
+            for helper_name in helper_list:
+                helper_cls, to_input_dir, to_output_dir = make_helper_factory(
+                    submit, helper_name, root)
+
+                def make_helper():
+                    output_dir = to_output_dir()
+                    if output_dir.is_relative_to(root) and output_dir.exists():
+                        output_dir.rmdir()
+                    return helper_cls(
+                        cfg_file=cfg_file,
+                        output_dir=output_dir,
+                        log_dir=root / 'logs' / helper_name,
+                        input_dir=to_input_dir(synthetic_dir),
+                        output_file=cfg_info.output_file,
+                        source_type=cfg_info.source_type)
+
+                stage_dict = {
+                    'make_itemdata': lambda: make_helper().make_itemdata(),
+                    'make_output_transfer_cmd': lambda: make_helper().make_output_transfer_cmd(),
+                    'queue': lambda: make_helper().queue(),
+                }
+
+                for stage in stage_list:
+                    if stage not in stage_dict:
+                        continue
+                    record = {'helper': helper_name, 'stage': stage, 'num_files': num_files}
+                    record |= measure(stage_dict[stage], repeat)
+                    result_list.append(record)
+                    print_record(record)
+
+    return result_list
+
+
+################################################################################
+# bookkeeping
+################################################################################
+def get_commit() -> str:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                cwd=SUBMIT_SCRIPT.parent,
+                                capture_output=True, text=True, check=True)
+        commit = commit.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = 'unknown'
+    return commit
+
+
+def record_key(record: dict) -> tuple:
+    return (record['helper'], record['stage'], record['num_files'])
+
+
+def print_record(record: dict) -> None:
+    helper = record['helper'] or '-'
+    print(f'{helper:<8s} {record["stage"]:<26s} {record["num_files"]:>9d} '
+          f'{record["time"] * 1e3:>12.3f} ms {record["peak_memory"] / 2**20:>10.3f} MiB')
+
+
+def load_results(output_path: Path) -> dict:
+    if output_path.exists():
+        with open(output_path, 'r') as json_file:
+            return json.load(json_file)
+    return {}
+
+
+def compare(results: dict, baseline: str, target: str) -> None:
+    for commit in (baseline, target):
+        if commit not in results:
+            raise KeyError(f'commit {commit} not found. Available: {list(results)}')
+
+    baseline_dict = {record_key(each): each for each in results[baseline]['records']}
+    target_dict = {record_key(each): each for each in results[target]['records']}
+
+    print(f'{baseline} -> {target}')
+    print(f'{"helper":<8s} {"stage":<26s} {"num_files":>9s} {"time":>10s} {"memory":>10s}')
+    for key in sorted(baseline_dict.keys() & target_dict.keys(), key=str):
+        helper, stage, num_files = key
+        time_ratio = target_dict[key]['time'] / max(baseline_dict[key]['time'], 1e-12)
+        memory_ratio = target_dict[key]['peak_memory'] / max(baseline_dict[key]['peak_memory'], 1)
+        print(f'{helper or "-":<8s} {stage:<26s} {num_files:>9d} '
+              f'{time_ratio:>9.3f}x {memory_ratio:>9.3f}x')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='number of files in each synthetic directory tree')
+    parser.add_argument('--helper', type=str, nargs='+', dest='helper_list',
+                        default=['Default', 'KISTI', 'Gate'],
+                        choices=['Default', 'KISTI', 'Gate'])
+    parser.add_argument('--stage', type=str, nargs='+', dest='stage_list',
+                        default=['from_file', 'make_itemdata', 'make_output_transfer_cmd', 'queue'],
+                        choices=['from_file', 'make_itemdata', 'make_output_transfer_cmd', 'queue'])
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('-w', '--workdir', type=Path,
+                        help='where to create the synthetic trees (e.g. a tmpfs)')
+    parser.add_argument('-o', '--output-path', type=Path,
+                        default=Path.cwd() / 'gem-dqm-submit-benchmark.json')
+    parser.add_argument('-c', '--compare', type=str, metavar='BASELINE_COMMIT',
+                        help='compare the stored results of BASELINE_COMMIT with the current commit')
+    parser.add_argument('--commit', type=str, help='defaults to the current git commit')
+    args = parser.parse_args()
+
+    commit = args.commit or get_commit()
+    results = load_results(args.output_path)
+
+    if args.compare is not None:
+        compare(results, args.compare, commit)
+        return
+
+    print(f'{"helper":<8s} {"stage":<26s} {"num_files":>9s} {"time":>15s} {"peak memory":>14s}')
+    record_list = run_benchmark(
+        sizes=args.sizes,
+        helper_list=args.helper_list,
+        stage_list=args.stage_list,
+        repeat=args.repeat,
+        workdir=args.workdir)
+
+    results[commit] = {
+        'hostname': socket.gethostname(),
+        'python': sys.version.split()[0],
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'records': record_list,
+    }
+    with open(args.output_path, 'w') as json_file:
+        json.dump(results, json_file, indent=4)
+    print(f'results of {commit=} written to {args.output_path}')
+
+
+if __name__ == '__main__':
+    main()